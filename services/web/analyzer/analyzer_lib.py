@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Dict, List, Set, Tuple, Optional, Callable, DefaultDict
+from typing import Dict, List, Set, Tuple, Optional, Union, Callable, DefaultDict
 from collections import Counter, defaultdict, OrderedDict
-from functools import lru_cache
 from time import time
+import hashlib
+import hmac
+import json
+import os
+import pickle
 
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.feature_extraction import text
@@ -30,6 +35,8 @@ log = logging.getLogger(__name__)
 
 DataFrame = pd.DataFrame
 TransformLookup = DefaultDict[DatasetId, Dict[DataViewId, Set[Transform]]]
+TransformKey = Tuple[str, ...]
+TransformKeyLookup = DefaultDict[DatasetId, Dict[TransformKey, DataViewId]]
 
 
 TAB = "\t"
@@ -45,6 +52,16 @@ class DataFrameCache:
 
 class Analyzer:
     DEFAULT_LIMIT = 250
+    # DataFrames kept in memory per dataset
+    DF_CACHE_SIZE = 128
+    DF_CACHE_DIRNAME = ".cache"
+    DF_CACHE_SUFFIX = ".pkl"
+    # signs the persisted DataFrames, so that files not written by the analyzer are never unpickled
+    DF_CACHE_SECRET_FILENAME = "secret"
+    # DataFrames kept on disk, the least recently used are removed first
+    DF_PERSIST_MAX_FILES = 32
+    # only DataFrames whose transforms take at least this long to apply are persisted
+    DF_PERSIST_MIN_SEC = 2.0
 
     def __init__(
         self,
@@ -62,55 +79,252 @@ class Analyzer:
         self._user_handler = user_handler
         self.transform_resource_handler = transform_resource_handler
 
-        self._active_dataframe_by_data_view: Dict[RichDataView, DataFrame] = {}
-        self._df_cache_by_dataset = defaultdict(OrderedDict)
+        # the raw DataFrame of each dataset, shared by all of its DataViews
+        self._active_dataframe_by_dataset: Dict[DatasetId, DataFrame] = {}
+        self._df_cache_by_dataset: DefaultDict[
+            DatasetId, OrderedDict[DataViewId, DataFrame]
+        ] = defaultdict(OrderedDict)
         self._data_view_transforms_by_dataset_id: TransformLookup = defaultdict(dict)
 
-    @lru_cache(maxsize=128)
+        # cached DataViews by their ordered transforms, to find a cached prefix of a new DataView
+        self._data_view_id_by_transform_key: TransformKeyLookup = defaultdict(dict)
+
+        # DataFrames persisted by earlier runs, loaded on first use
+        self._df_cache_dir = self.data_dir / self.DF_CACHE_DIRNAME
+        self._df_cache_secret: Optional[bytes] = None
+
     def _get_df(self, data_view: RichDataView) -> DataFrame:
         data_view_id = data_view.id
         dataset_id = data_view.dataset_id
 
+        # the DataFrames of each dataset, least recently used first
         df_cache = self._df_cache_by_dataset[dataset_id]
         transforms_by_data_view_id = self._data_view_transforms_by_dataset_id[dataset_id]
 
-        if data_view_id not in df_cache:
-            log.info("data_view_id %s not in cache", data_view_id)
-            # find best starting point
-            cached_data_view_id, remaining_transforms = self.get_id_of_best_base_df(
-                data_view.transforms, transforms_by_data_view_id,
-            )
+        if data_view_id in df_cache:
+            log.info(f"loading cached DataView {data_view_id}")
+            df_cache.move_to_end(data_view_id)
+            return df_cache[data_view_id]
 
-            log.info("best base_df: %s", cached_data_view_id)
+        log.info("data_view_id %s not in cache", data_view_id)
 
-            if cached_data_view_id:
-                df = self._get_df(self.rich_data_view(cached_data_view_id))
-                log.info(f"generating DataView {data_view_id} from {cached_data_view_id}")
-                transforms = remaining_transforms
-            else:
-                log.info(f"generating DataView {data_view_id} from base")
-                df = self.active_dataframe(data_view)
-                transforms = data_view.transforms
+        df = self._load_persisted_df(data_view)
+        if df is None:
+            df = self._generate_df(data_view, transforms_by_data_view_id)
+
+        df_cache[data_view_id] = df
+        transforms_by_data_view_id[data_view_id] = data_view.transforms
 
-            for transform in transforms:
-                if isinstance(transform, FilterTransform):
-                    df = transform.filter(df, self.transform_resource_handler.instance(data_view))
+        transform_key = self.get_transform_key(data_view.transforms)
+        self._data_view_id_by_transform_key[dataset_id][transform_key] = data_view_id
+
+        while len(df_cache) > self.DF_CACHE_SIZE:
+            evicted_data_view_id, _ = df_cache.popitem(last=False)
+            self._evict_df(dataset_id, evicted_data_view_id)
+
+        return df
+
+    def _evict_df(self, dataset_id: DatasetId, data_view_id: DataViewId):
+        log.info("evicting cached DataView %s", data_view_id)
+        self._data_view_transforms_by_dataset_id[dataset_id].pop(data_view_id, None)
+
+        id_by_transform_key = self._data_view_id_by_transform_key[dataset_id]
+        for transform_key, cached_data_view_id in list(id_by_transform_key.items()):
+            if cached_data_view_id == data_view_id:
+                del id_by_transform_key[transform_key]
+
+    def _generate_df(
+        self,
+        data_view: RichDataView,
+        transforms_by_data_view_id: Dict[DataViewId, Set[Transform]],
+    ) -> DataFrame:
+        data_view_id = data_view.id
 
-                elif isinstance(transform, EnrichmentTransform):
-                    result = transform.enrich(df, self.transform_resource_handler.instance(data_view))
+        # find best starting point
+        cached_data_view_id, remaining_transforms = self.get_id_of_nearest_df(
+            data_view.transforms,
+            self._data_view_id_by_transform_key[data_view.dataset_id],
+            transforms_by_data_view_id,
+        )
 
-                    """
-                    column_label, is_sort_ascending = result.sort
-                    if column_label:
-                        df = df.sort_values(by=[column_label], ascending=is_sort_ascending)
-                    """
+        log.info("best base_df: %s", cached_data_view_id)
 
-            df_cache[data_view_id] = df
-            transforms_by_data_view_id[data_view_id] = data_view.transforms
+        if cached_data_view_id:
+            df = self._get_df(self.rich_data_view(cached_data_view_id))
+            log.info(f"generating DataView {data_view_id} from {cached_data_view_id}")
+            transforms = remaining_transforms
         else:
-            log.info(f"loading cached DataView {data_view_id}")
+            log.info(f"generating DataView {data_view_id} from base")
+            df = self.active_dataframe(data_view)
+            transforms = data_view.transforms
+
+            # enrichments add columns in place, which must not reach the dataset's shared DataFrame
+            if df is not None and any(isinstance(t, EnrichmentTransform) for t in transforms):
+                df = df.copy()
+
+        start_time = time()
+        for transform in transforms:
+            if isinstance(transform, FilterTransform):
+                df = transform.filter(df, self.transform_resource_handler.instance(data_view))
+
+            elif isinstance(transform, EnrichmentTransform):
+                result = transform.enrich(df, self.transform_resource_handler.instance(data_view))
+
+                """
+                column_label, is_sort_ascending = result.sort
+                if column_label:
+                    df = df.sort_values(by=[column_label], ascending=is_sort_ascending)
+                """
+
+        # only the transforms are timed, as persisting does not save loading the starting DataFrame
+        if time() - start_time >= self.DF_PERSIST_MIN_SEC and self.is_persistable(data_view):
+            self._persist_df(data_view, df)
 
-        return df_cache[data_view_id]
+        return df
+
+    @staticmethod
+    def is_persistable(data_view: RichDataView) -> bool:
+        # base DataViews are cheaper to reload than to unpickle, and DataViews whose transforms
+        # read tags or the autocat corpus could go stale without their dataset changing
+        return bool(data_view.transforms) and not any(
+            transform.READS_RESOURCES for transform in data_view.transforms
+        )
+
+    def _get_persisted_df_key(self, data_view: RichDataView) -> str:
+        return DataViewHandler._serialize_for_cache(data_view.dataset_id, data_view.transforms)
+
+    def _get_persisted_df_path(self, persisted_df_key: str) -> Path:
+        # named by what the DataView contains rather than by its id, as ids can be reused
+        digest = hashlib.sha1(persisted_df_key.encode("utf-8")).hexdigest()
+        return self._df_cache_dir / f"{digest}{self.DF_CACHE_SUFFIX}"
+
+    def _get_df_cache_secret(self) -> bytes:
+        """Read the key persisted DataFrames are signed with, creating it on first use"""
+        if self._df_cache_secret is None:
+            path = self._df_cache_dir / self.DF_CACHE_SECRET_FILENAME
+            self._df_cache_dir.mkdir(exist_ok=True)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                self._df_cache_secret = path.read_bytes()
+            else:
+                secret = os.urandom(32)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(secret)
+                self._df_cache_secret = secret
+
+        return self._df_cache_secret
+
+    def _sign_persisted_df(self, persisted_df_key: str, pickled_df: bytes) -> str:
+        message = persisted_df_key.encode("utf-8") + b"\n" + pickled_df
+        return hmac.new(self._get_df_cache_secret(), message, hashlib.sha256).hexdigest()
+
+    def _persist_df(self, data_view: RichDataView, df: Optional[DataFrame]):
+        """Write the DataFrame to disk so that it can be reused after a restart"""
+        if df is None:
+            return
+
+        persisted_df_key = self._get_persisted_df_key(data_view)
+        path = self._get_persisted_df_path(persisted_df_key)
+        try:
+            pickled_df = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+            signature = self._sign_persisted_df(persisted_df_key, pickled_df)
+
+            # a header line with the key and signature, checked before the DataFrame is unpickled
+            with path.open("wb") as f:
+                f.write(json.dumps([persisted_df_key, signature]).encode("utf-8") + b"\n")
+                f.write(pickled_df)
+        except Exception as exc:
+            log.warning("Could not persist DataView %s to '%s': %s", data_view.id, path, exc)
+            return
+
+        self._prune_persisted_dfs()
+
+    def _prune_persisted_dfs(self):
+        """Remove the least recently used persisted DataFrames beyond DF_PERSIST_MAX_FILES"""
+        try:
+            paths = sorted(
+                self._df_cache_dir.glob(f"*{self.DF_CACHE_SUFFIX}"),
+                key=lambda path: path.stat().st_mtime,
+            )
+            for path in paths[:-self.DF_PERSIST_MAX_FILES]:
+                log.info("removing persisted DataFrame '%s'", path)
+                path.unlink()
+        except Exception as exc:
+            log.warning("Could not prune persisted DataFrames: %s", exc)
+
+    def _load_persisted_df(self, data_view: RichDataView) -> Optional[DataFrame]:
+        """Load a DataFrame persisted by an earlier run, unless its dataset has changed since"""
+        persisted_df_key = self._get_persisted_df_key(data_view)
+        path = self._get_persisted_df_path(persisted_df_key)
+        if not path.exists():
+            return None
+
+        try:
+            if path.stat().st_mtime < self.get_dataset_path(data_view).stat().st_mtime:
+                log.info("persisted DataView %s is older than its dataset", data_view.id)
+                return None
+
+            log.info("loading persisted DataView %s from '%s'", data_view.id, path)
+            with path.open("rb") as f:
+                stored_key, signature = json.loads(f.readline())
+                if stored_key != persisted_df_key:
+                    log.warning("persisted DataFrame '%s' belongs to a different DataView", path)
+                    return None
+
+                pickled_df = f.read()
+
+            expected_signature = self._sign_persisted_df(persisted_df_key, pickled_df)
+            if not hmac.compare_digest(signature, expected_signature):
+                log.warning("persisted DataFrame '%s' was not written by this analyzer", path)
+                return None
+
+            df = pickle.loads(pickled_df)
+
+            # mark as recently used, for pruning; it is still newer than its dataset
+            path.touch()
+            return df
+        except Exception as exc:
+            log.warning("Could not load persisted DataView %s: %s", data_view.id, exc)
+            return None
+
+    @staticmethod
+    def get_transform_key(transforms: List[Transform]) -> TransformKey:
+        return tuple(json.dumps(transform.serialize()) for transform in transforms)
+
+    @classmethod
+    def get_id_of_cached_prefix_df(
+        cls,
+        target_transforms: List[Transform],
+        id_by_transform_key: Dict[TransformKey, DataViewId],
+    ) -> Tuple[Optional[DataViewId], List[Transform]]:
+        target_transforms = list(target_transforms)
+        target_key = cls.get_transform_key(target_transforms)
+
+        # seek out the cached DataView sharing the longest (non-empty) prefix of transforms
+        # with the target; the base DataView is left to get_id_of_best_base_df
+        for prefix_len in range(len(target_key), 0, -1):
+            cached_data_view_id = id_by_transform_key.get(target_key[:prefix_len])
+            if cached_data_view_id:
+                return cached_data_view_id, target_transforms[prefix_len:]
+
+        return None, target_transforms
+
+    @classmethod
+    def get_id_of_nearest_df(
+        cls,
+        target_transforms: List[Transform],
+        id_by_transform_key: Dict[TransformKey, DataViewId],
+        cached_transforms: Dict[DataViewId, Set[Transform]],
+    ) -> Tuple[Optional[DataViewId], Union[List[Transform], Set[Transform]]]:
+        # probing the prefixes is cheap, so the scan over every cached DataView is only a fallback
+        prefix_id, prefix_remaining = cls.get_id_of_cached_prefix_df(
+            target_transforms, id_by_transform_key,
+        )
+        if prefix_id:
+            return prefix_id, prefix_remaining
+
+        return cls.get_id_of_best_base_df(target_transforms, cached_transforms)
 
     @staticmethod
     def get_id_of_best_base_df(
@@ -149,7 +363,7 @@ class Analyzer:
     def rich_data_view(self, data_view_id: DataViewId) -> RichDataView:
         data_view = self._data_view_handler.by_id(data_view_id)
         log.info("DataView %s from %s", data_view, data_view_id)
-        return RichDataView(
+        return RichDataView.acquire(
             data_view=data_view,
             dataset=self._dataset_handler.by_id(data_view.dataset_id),
             user=self._user_handler.by_id(data_view.user_id),
@@ -195,14 +409,15 @@ class Analyzer:
         return self.data_dir / data_view.dataset.filename
 
     def active_dataframe(self, data_view: RichDataView) -> DataFrame:
-        if self._active_dataframe_by_data_view.get(data_view) is None:
+        dataset_id = data_view.dataset_id
+        if self._active_dataframe_by_dataset.get(dataset_id) is None:
             try:
                 path = self.get_dataset_path(data_view)
                 df = self._load_data(path=path, data_view=data_view)
-                self._active_dataframe_by_data_view[data_view] = df
+                self._active_dataframe_by_dataset[dataset_id] = df
             except Exception as exc:
                 log.error(exc)
-        return self._active_dataframe_by_data_view.get(data_view)
+        return self._active_dataframe_by_dataset.get(dataset_id)
 
     def raw_data_for_data_view(
         self,
@@ -284,13 +499,16 @@ class Analyzer:
         vectorizer = CountVectorizer(stop_words=stop_words)
         result = vectorizer.fit_transform(
             [' '.join(df[df[cat_col] == c][tex_col].tolist()) for c in categories]
-        )
+        ).tocsr()
 
-        words = vectorizer.get_feature_names()
-        words_by_categories = pd.DataFrame(
-            result.todense(), index=categories, columns=words,
-        )
-        categories_by_words = words_by_categories.T
+        words = np.asarray(vectorizer.get_feature_names(), dtype=object)
+
+        # extract top n by_category, reading each category's nonzero counts from the sparse row
+        # rather than densifying the full categories x vocabulary matrix
+        top_words_by_category = {}
+        for i, c in enumerate(categories):
+            row = result.getrow(i)
+            counts = pd.Series(row.data, index=words[row.indices]).sort_index()
+            top_words_by_category[c] = counts.nlargest(count).to_dict()
 
-        # extract top n by_category
-        return {c: categories_by_words[c].nlargest(count).to_dict() for c in categories}
+        return top_words_by_category
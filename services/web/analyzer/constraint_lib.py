@@ -302,6 +302,9 @@ class Transform(Serializable, ABC):
     KEY_DESC = "description"
     KEY_PARAMETERS = "params"
 
+    # whether the result depends on state outside of the DataFrame, such as tags or the autocat corpus
+    READS_RESOURCES = False
+
     def __init__(self, operation: str):
         self._operation = operation
 
@@ -836,6 +839,7 @@ class ProblemReport(EnrichmentTransform):
 @register
 class Categorization(EnrichmentTransform):
     LABEL_CATEGORY = "autocat1"
+    READS_RESOURCES = True
 
     def __init__(
         self,
@@ -960,6 +964,8 @@ class Categorization(EnrichmentTransform):
 
 @register
 class HasTag(FilterTransform):
+    READS_RESOURCES = True
+
     def __init__(self, tag: str, operation: str):
         self.tag = str(tag)
         super().__init__(operation)
@@ -1007,6 +1013,7 @@ class HasTag(FilterTransform):
 @register
 class Tag(EnrichmentTransform):
     TAG_COLUMN_LABEL = "tag"
+    READS_RESOURCES = True
 
     def __init__(
         self,
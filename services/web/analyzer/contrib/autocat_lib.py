@@ -1,14 +1,20 @@
 
-from collections import Counter, defaultdict, deque, namedtuple
-from typing import List, Dict, DefaultDict, Set, Tuple, Union, Optional
+from collections import Counter, OrderedDict, defaultdict, deque, namedtuple
+from typing import (
+    List, Dict, DefaultDict, Set, FrozenSet, Tuple, Union, Optional, Iterable, Iterator,
+)
 from itertools import chain
 from time import time
 from copy import deepcopy
 import math
+import os
+import re
+import sys
 import logging
 
+import numpy as np
 from scipy.stats import entropy
-from pandas import DataFrame
+from pandas import DataFrame, Series
 
 # spaCy based imports
 from spacy.tokens import Token as SpacyToken
@@ -23,6 +29,14 @@ log = logging.getLogger(__name__)
 
 SPACE = " "
 
+# batching used when feeding many texts through the spaCy pipeline at once
+PIPE_BATCH_SIZE = 512
+# spaCy forks worker processes for n_process > 1, which is unsafe from the threaded server,
+# so parsing stays in-process unless AUTOCAT_PIPE_N_PROCESS asks for more
+PIPE_N_PROCESS = max(1, int(os.environ.get("AUTOCAT_PIPE_N_PROCESS", 1)))
+# smaller batches are always parsed in-process, as starting the workers would cost more than it saves
+PIPE_MULTIPROCESS_MIN_TEXTS = 10000
+
 dep_direct_obj = "dobj"
 dep_indirect_obj = "iobj"
 dep_obj_of_prep = "pobj"
@@ -43,7 +57,23 @@ pos_det = "DET"
 tag_personal_pronoun = "PRP"
 tag_possessive = "POS"
 
-TokenEntry = namedtuple("TokenEntry", "id age dep pos tag token")
+# dependency labels, by spaCy's integer id for the label, are interned to small integer codes
+DEP_CODES: Dict[int, int] = {}
+
+
+def get_dep_code(dep: int) -> int:
+    return DEP_CODES.setdefault(dep, len(DEP_CODES))
+
+
+def get_dep_codes(deps: Iterable[int]) -> List[int]:
+    return [DEP_CODES[dep] for dep in deps if dep in DEP_CODES]
+
+
+# columns of the flattened token table used for counting
+KEY_TOKEN_ID = "token_id"
+KEY_ENTRY_ID = "entry_id"
+KEY_AGE = "age"
+KEY_DEP = "dep"
 
 DatasetEntry = namedtuple("DatasetEntry", "id pkey age text")
 
@@ -54,6 +84,68 @@ class EntryId(int):
     pass
 
 
+# (entry ids, exclude words, corpus version)
+CategoryTreeKey = Tuple[Optional[FrozenSet[EntryId]], FrozenSet[str], int]
+# a category tree along with the processor state set while building it
+CachedCategoryTree = namedtuple(
+    "CachedCategoryTree",
+    "category_tree num_categories debug_token_counts debug_counts_by_category",
+)
+CategoryTreeCache = Dict[CategoryTreeKey, CachedCategoryTree]
+
+
+# every (token, entry) occurrence in the corpus, in the order they were added, stored as
+# parallel arrays shared by all tokens rather than as one tuple (or array) per token
+class TokenOccurrences:
+    __slots__ = ("_token_ids", "_entry_ids", "_ages", "_deps", "_size")
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self._token_ids = np.empty(self.INITIAL_CAPACITY, dtype=np.int32)
+        self._entry_ids = np.empty(self.INITIAL_CAPACITY, dtype=np.int32)
+        self._ages = np.empty(self.INITIAL_CAPACITY, dtype=np.int16)
+        self._deps = np.empty(self.INITIAL_CAPACITY, dtype=np.int8)
+        self._size = 0
+
+    def append(self, token_id: int, entry_id: EntryId, age: int, dep_code: int):
+        if self._size == len(self._token_ids):
+            self._grow()
+
+        size = self._size
+        self._token_ids[size] = token_id
+        self._entry_ids[size] = entry_id
+        self._ages[size] = age
+        self._deps[size] = dep_code
+        self._size = size + 1
+
+    def _grow(self):
+        capacity = 2 * len(self._token_ids)
+        self._token_ids = np.resize(self._token_ids, capacity)
+        self._entry_ids = np.resize(self._entry_ids, capacity)
+        self._ages = np.resize(self._ages, capacity)
+        self._deps = np.resize(self._deps, capacity)
+
+    @property
+    def token_ids(self) -> np.ndarray:
+        return self._token_ids[:self._size]
+
+    @property
+    def entry_ids(self) -> np.ndarray:
+        return self._entry_ids[:self._size]
+
+    @property
+    def ages(self) -> np.ndarray:
+        return self._ages[:self._size]
+
+    @property
+    def deps(self) -> np.ndarray:
+        return self._deps[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+
 class TextProcessor:
     def __init__(self, parser: SpacyParser):
         self.parser = parser
@@ -76,6 +168,19 @@ class TextProcessor:
             ("website", "site"),
         ]
 
+        # apply the single character corrections with one translate() and the rest with one regex
+        self._char_corrections = str.maketrans({
+            original: replacement
+            for original, replacement in self._text_corrections if len(original) == 1
+        })
+        self._phrase_corrections = {
+            original: replacement
+            for original, replacement in self._text_corrections if len(original) > 1
+        }
+        self._phrase_corrections_re = re.compile(
+            "|".join(re.escape(original) for original in self._phrase_corrections)
+        )
+
         self._collapse_hyphens = True
         self._do_add_phrases = False
         self._do_add_bigrams = True
@@ -84,40 +189,73 @@ class TextProcessor:
         self.pos_ignore = {pos_pronoun, pos_det, pos_symbol, pos_punc}
         self.tag_ignore = {tag_personal_pronoun, tag_possessive}
 
+        # words repeat heavily across documents, so remember each vocab lookup
+        self._oov_cache: Dict[str, bool] = {}
+
     def is_oov(self, word: str) -> bool:
-        if word not in self.parser.vocab and not self.parser.vocab.has_vector(word):
-            return True
-        return False
+        is_oov = self._oov_cache.get(word)
+        if is_oov is None:
+            vocab = self.parser.vocab
+            is_oov = word not in vocab and not vocab.has_vector(word)
+            self._oov_cache[word] = is_oov
+        return is_oov
 
     @staticmethod
-    def get_bigrams(words: List[str]) -> List[str]:
+    def get_bigrams(words: List[str]) -> Iterator[str]:
         if len(words) < 2:
-            return []
-        last_word = words[-1]
-        return [f"{word} {last_word}".lower() for word in words[:-1]]
+            return
+        # each bigram pairs a word with the last word, so lowercase the shared suffix only once
+        suffix = SPACE + words[-1].lower()
+        for word in words[:-1]:
+            yield word.lower() + suffix
 
     def cleanse_text(self, text: str) -> str:
         if self._collapse_hyphens:
             text = text.replace("-", "")
 
-        for original, replacement in self._text_corrections:
-            text = text.replace(original, replacement)
+        text = text.translate(self._char_corrections)
 
-        return text
+        phrase_corrections = self._phrase_corrections
+        return self._phrase_corrections_re.sub(lambda m: phrase_corrections[m.group(0)], text)
 
-    def process(self, text: str, doc_id: str) -> DefaultDict[str, List[SpacyToken]]:
+    def process(self, text: str, doc_id: str) -> Dict[str, SpacyToken]:
         doc = self.parser(self.cleanse_text(text))
 
         if doc_id:
             self.doc_by_id[doc_id] = doc
 
-        tokens = defaultdict(list)
+        return self._tokens_from_doc(doc)
+
+    @staticmethod
+    def get_pipe_n_process(num_texts: int) -> int:
+        """Return the number of processes to parse this many texts with"""
+        return PIPE_N_PROCESS if num_texts >= PIPE_MULTIPROCESS_MIN_TEXTS else 1
+
+    def process_many(
+        self,
+        texts: Iterable[str],
+        doc_ids: Iterable[str],
+        batch_size: int = PIPE_BATCH_SIZE,
+        n_process: int = 1,
+    ) -> Iterator[Tuple[str, Dict[str, SpacyToken]]]:
+        # parse in batches (and across processes), yielding (doc_id, tokens) in input order
+        cleansed_texts = (self.cleanse_text(text) for text in texts)
+        docs = self.parser.pipe(cleansed_texts, batch_size=batch_size, n_process=n_process)
+
+        for doc, doc_id in zip(docs, doc_ids):
+            if doc_id:
+                self.doc_by_id[doc_id] = doc
+
+            yield doc_id, self._tokens_from_doc(doc)
+
+    def _tokens_from_doc(self, doc) -> Dict[str, SpacyToken]:
+        tokens: Dict[str, SpacyToken] = {}
         for chunk in doc.noun_chunks:
             self._process_noun_chunk(chunk, tokens)
 
         return tokens
 
-    def _process_noun_chunk(self, chunk, tokens: DefaultDict[str, List[SpacyToken]]):
+    def _process_noun_chunk(self, chunk, tokens: Dict[str, SpacyToken]):
         pos_ignore = self.pos_ignore
         tag_ignore = self.tag_ignore
         lemmatization_corrections = self._spacy_lemmatization_corrections
@@ -166,16 +304,30 @@ class Corpus:
         self.pkey_by_id: Dict[EntryId, str] = {}
         self.id_by_pkey: Dict[str, EntryId] = {}
 
-        self.token_entry_lookup: DefaultDict[str, List[TokenEntry]] = defaultdict(list)
+        self.occurrences = TokenOccurrences()
         self.tokens_by_id = defaultdict(list)
 
+        # each distinct (interned) token string is assigned an integer id in order of appearance
+        self.token_id_by_token: Dict[str, int] = {}
+        self.tokens: List[str] = []
+
         self.text_by_id: DefaultDict[EntryId, str] = defaultdict(str)
         self.unigrams_by_id: DefaultDict[EntryId, List[str]] = defaultdict(list)
 
         self.age_in_weeks_max = -1
         self.age_in_weeks_min = 520000
 
-    def add_entry(self, entry: DatasetEntry):
+        # bumped on every added entry, so that results derived from the corpus can be invalidated
+        self.version = 0
+
+        # category trees built from this corpus, keyed by (entry ids, version); see CorpusProcessor
+        self.category_tree_cache: CategoryTreeCache = OrderedDict()
+
+    def add_entry(
+        self,
+        entry: DatasetEntry,
+        tokens: Optional[Dict[str, SpacyToken]] = None,
+    ):
         raw_text = entry.text
         age_in_weeks = int(entry.age) // 7
 
@@ -192,16 +344,28 @@ class Corpus:
 
         self.text_by_id[entry.id] = raw_text
 
-        for string, token in self.text_processor.process(raw_text, entry.id).items():
-
-            token_entry = TokenEntry(
-                id=entry.id, age=age_in_weeks, dep=token.dep_, pos=token.pos_, tag=token.tag_,
-                token=token,
+        # parse the text unless its tokens were already extracted, e.g. by `process_many`
+        if tokens is None:
+            tokens = self.text_processor.process(raw_text, entry.id)
+
+        token_id_by_token = self.token_id_by_token
+        for string, token in tokens.items():
+            string = sys.intern(string)
+            token_id = token_id_by_token.get(string)
+            if token_id is None:
+                token_id = token_id_by_token[string] = len(self.tokens)
+                self.tokens.append(string)
+
+            self.occurrences.append(
+                token_id=token_id,
+                entry_id=entry.id,
+                age=age_in_weeks,
+                dep_code=get_dep_code(token.dep),
             )
-
-            self.token_entry_lookup[string].append(token_entry)
             self.tokens_by_id[entry.id].append(string)
 
+        self.version += 1
+
     @classmethod
     def from_df(
         cls,
@@ -215,20 +379,29 @@ class Corpus:
 
         start_time = time()
         log.info(f"processing rows...")
-        index = 0
-        for _, row in df.iterrows():
-            text = row[text_column_name].strip()
 
-            pkey = row[pkey_column_name]
-            age = row[age_column_name]
+        # pull each column out once, rather than building a Series for every row
+        texts = df[text_column_name].astype(str).str.strip().to_numpy()
+        pkeys = df[pkey_column_name].to_numpy()
+        ages = df[age_column_name].to_numpy()
+
+        entries = [
+            DatasetEntry(index, pkey, age, text)
+            for index, (text, pkey, age) in enumerate(zip(texts, pkeys, ages))
+        ]
 
-            entry = DatasetEntry(index, pkey, age, text)
+        # parse all of the texts in batches, rather than one call to the parser per row
+        processed = text_processor.process_many(
+            texts=(entry.text for entry in entries),
+            doc_ids=(entry.id for entry in entries),
+            n_process=text_processor.get_pipe_n_process(len(entries)),
+        )
 
-            corpus.add_entry(entry)
-            index += 1
+        for entry, (_, tokens) in zip(entries, processed):
+            corpus.add_entry(entry, tokens)
 
         time_elapsed = time() - start_time
-        log.info(f"processed {index} rows in {time_elapsed:.1f} sec")
+        log.info(f"processed {len(texts)} rows in {time_elapsed:.1f} sec")
 
         return corpus
 
@@ -242,6 +415,8 @@ class CorpusProcessor:
     DEFAULT_SUBCATEGORY = "misc"
     DEFAULT_PAIR = DEFAULT_CATEGORY, DEFAULT_SUBCATEGORY
 
+    CATEGORY_TREE_CACHE_SIZE = 32
+
     def __init__(self, corpus: Corpus, exclude_words: Set[str] = None):
         self._corpus = corpus
         self._category_tree = None
@@ -252,7 +427,6 @@ class CorpusProcessor:
         self._pkey_by_id: Dict[EntryId, str] = corpus.pkey_by_id
         self._id_by_pkey: Dict[str, EntryId] = corpus.id_by_pkey
 
-        self._token_entry_lookup: DefaultDict[str, List[TokenEntry]] = corpus.token_entry_lookup
         self._tokens_by_id: DefaultDict[EntryId, List[str]] = corpus.tokens_by_id
 
         self.text_by_id: DefaultDict[EntryId, str] = corpus.text_by_id
@@ -264,15 +438,59 @@ class CorpusProcessor:
         self.exclude_words = exclude_words or set()
         self.num_categories = None
 
+        # tokens containing any exclude word, found once rather than per token per time window
+        self._excluded_tokens: FrozenSet[str] = self._find_excluded_tokens(
+            tokens=corpus.tokens,
+            exclude_words=self.exclude_words,
+        )
+
+        self._token_table: Optional[DataFrame] = None
+        self._entry_ids_by_token_id: Optional[List[np.ndarray]] = None
+
+        # shared through the corpus, as a new CorpusProcessor is created for every model build
+        self._category_tree_cache: CategoryTreeCache = corpus.category_tree_cache
+
         self.lm_by_category: LmCategoryLookup = defaultdict(Counter)
         self.lm_by_subcategory: LmSubcategoryLookup = defaultdict(lambda: defaultdict(Counter))
 
     def build_model(self, entry_ids: Optional[List[EntryId]] = None):
-        category_tree = self._build_category_tree(entry_ids)
+        category_tree = self._get_category_tree(entry_ids)
         category_tree = self._build_language_models(category_tree)
 
         self._category_tree = category_tree
 
+    def _get_category_tree(self, entry_ids: Optional[List[EntryId]] = None) -> CategoryTree:
+        key = (
+            frozenset(entry_ids) if entry_ids else None,
+            frozenset(self.exclude_words),
+            self._corpus.version,
+        )
+
+        cache = self._category_tree_cache
+        try:
+            cached = cache[key]
+        except KeyError:
+            pass
+        else:
+            cache.move_to_end(key)
+            self.num_categories = cached.num_categories
+            self.debug_token_counts = cached.debug_token_counts
+            self.debug_counts_by_category = cached.debug_counts_by_category
+            return cached.category_tree
+
+        category_tree = self._build_category_tree(entry_ids)
+
+        cache[key] = CachedCategoryTree(
+            category_tree=category_tree,
+            num_categories=self.num_categories,
+            debug_token_counts=self.debug_token_counts,
+            debug_counts_by_category=self.debug_counts_by_category,
+        )
+        while len(cache) > self.CATEGORY_TREE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+        return category_tree
+
     @classmethod
     def _category_count_heuristic(cls, counts: Counter):
         ignore_count = 5
@@ -292,16 +510,17 @@ class CorpusProcessor:
     def _build_category_tree(
         self, entry_ids: Optional[List[EntryId]] = None,
     ) -> DefaultDict[str, List[str]]:
-        exclude_words = self.exclude_words
+        include_dep_names = {dep_direct_obj, dep_obj_of_prep, dep_root, dep_appos}
+        # include_dep_names.add(dep_subj)
+        # include_dep_names.add(dep_sub_clausal)
+        # include_dep_names.add(dep_sub_clausal_pass)
 
-        include_deps = {dep_direct_obj, dep_obj_of_prep, dep_root, dep_appos}
-        # include_deps.add(dep_subj)
-        # include_deps.add(dep_sub_clausal)
-        # include_deps.add(dep_sub_clausal_pass)
+        # dependency labels are compared by spaCy's integer ids rather than by string
+        strings = self._text_processor.parser.vocab.strings
+        include_deps = {strings[dep] for dep in include_dep_names}
 
         token_counts = self._get_time_weighted_counts(
             include_deps=include_deps,
-            exclude_words=exclude_words,
             entry_ids=entry_ids,
         )
 
@@ -318,8 +537,7 @@ class CorpusProcessor:
 
     def _get_time_weighted_counts(
         self,
-        include_deps: Set[str],
-        exclude_words: Set[str],
+        include_deps: Set[int],
         entry_ids: Optional[List[EntryId]] = None,
     ) -> Counter:
         min_len = 2
@@ -329,6 +547,17 @@ class CorpusProcessor:
         min_age_exponent = 2
         max_age_exponent = int(1 + math.log(self.age_in_weeks_max, base))
 
+        # narrow the token table to the allowable entries and tokens once, not once per window
+        token_table = self._get_token_table()
+        token_id_by_token = self._corpus.token_id_by_token
+        is_candidate = ~token_table[KEY_TOKEN_ID].isin(
+            [token_id_by_token[token] for token in self._excluded_tokens]
+        )
+        if entry_ids:
+            is_candidate &= token_table[KEY_ENTRY_ID].isin(frozenset(entry_ids))
+
+        candidates = token_table[is_candidate]
+
         weighted_token_counts = Counter()
 
         # at each iteration, consider a time window `base` times the window of the iteration before
@@ -341,8 +570,7 @@ class CorpusProcessor:
                 min_age=min_age,
                 max_age=max_age,
                 include_deps=include_deps,
-                exclude_words=exclude_words,
-                entry_ids=entry_ids,
+                candidates=candidates,
             )
 
             # ensure weights follow the pattern
@@ -357,58 +585,68 @@ class CorpusProcessor:
 
         return weighted_token_counts
 
-    def _count_tokens_in_time_window_x(
-        self, max_age: int, include_deps: Set[str], exclude_words: Set[str],
-    ) -> Counter:
-
-        def is_relevant(entry: TokenEntry) -> bool:
-            return entry.age <= max_age and entry.dep in include_deps
+    def _get_token_table(self) -> DataFrame:
+        # one row per (token, entry), built once per processor
+        if self._token_table is None:
+            occurrences = self._corpus.occurrences
+            token_table = DataFrame({
+                KEY_TOKEN_ID: occurrences.token_ids,
+                KEY_ENTRY_ID: occurrences.entry_ids,
+                KEY_AGE: occurrences.ages,
+                KEY_DEP: occurrences.deps,
+            })
+
+            # order the rows as the entries are visited by age, keeping the order they were added
+            # in within an age, so that counts are reported in order of first occurrence;
+            # Counter.most_common breaks ties by that order
+            self._token_table = token_table.sort_values(KEY_AGE, kind="stable", ignore_index=True)
+        return self._token_table
+
+    def _get_entry_ids_of_token(self, token: str) -> np.ndarray:
+        # the entries of every token, in the order they were added, indexed once per processor
+        if self._entry_ids_by_token_id is None:
+            occurrences = self._corpus.occurrences
+            token_ids = occurrences.token_ids
+            order = np.argsort(token_ids, kind="stable")
+            counts = np.bincount(token_ids, minlength=len(self._corpus.tokens))
+            self._entry_ids_by_token_id = np.split(
+                occurrences.entry_ids[order], np.cumsum(counts)[:-1],
+            )
 
-        token_counts = Counter()
-        for token, token_entries in self._token_entry_lookup.items():
-            # TODO: Replace with regex
-            if any(exclude_word in token for exclude_word in exclude_words):
-                continue
+        token_id = self._corpus.token_id_by_token.get(token)
+        if token_id is None:
+            return np.empty(0, dtype=np.int32)
+        return self._entry_ids_by_token_id[token_id]
 
-            # count only the relevant entries
-            token_counts[token] += len([entry for entry in token_entries if is_relevant(entry)])
+    @staticmethod
+    def _find_excluded_tokens(tokens: Iterable[str], exclude_words: Set[str]) -> FrozenSet[str]:
+        if not exclude_words:
+            return frozenset()
 
-        return token_counts
+        # a token is excluded when any of the exclude words appears within it
+        pattern = re.compile("|".join(re.escape(exclude_word) for exclude_word in exclude_words))
+        return frozenset(token for token in tokens if pattern.search(token))
 
     def _count_tokens_in_time_window(
         self,
         min_age: int,
         max_age: int,
-        include_deps: Set[str],
-        exclude_words: Set[str],
-        entry_ids: Optional[List[EntryId]] = None,
+        include_deps: Set[int],
+        candidates: DataFrame,
     ) -> Counter:
+        in_window = candidates[candidates[KEY_AGE].between(min_age, max_age)]
 
-        allowable_entry_ids = set(entry_ids or [])
-
-        def is_relevant(entry: TokenEntry) -> bool:
-            return min_age <= entry.age <= age and entry.dep in include_deps
-
-        token_counts = Counter()
-        for age in range(min_age, max_age + 1):
-            for entry_id in self._ids_by_age.get(age, []):
-                if allowable_entry_ids and entry_id not in allowable_entry_ids:
-                    continue
-
-                tokens = self._tokens_by_id.get(entry_id, [])
-                for token in tokens:
-                    if any(exclude_word in token for exclude_word in exclude_words):
-                        continue
-
-                    token_entries = self._token_entry_lookup.get(token, [])
+        # count only the relevant entries
+        is_relevant = in_window[KEY_DEP].isin(get_dep_codes(include_deps))
 
-                    # count only the relevant entries
-                    token_counts[token] += len(
-                        [entry for entry in token_entries if
-                         entry.id == entry_id and is_relevant(entry)]
-                    )
+        return self._count_by_token(is_relevant, in_window[KEY_TOKEN_ID])
 
-        return token_counts
+    def _count_by_token(self, is_relevant: Series, token_ids: Series) -> Counter:
+        # group on the integer token ids, only mapping back to strings for the final counts;
+        # tokens keep the order of their first row
+        tokens = self._corpus.tokens
+        counts = is_relevant.groupby(token_ids, sort=False).sum()
+        return Counter({tokens[token_id]: int(count) for token_id, count in counts.items()})
 
     def _build_initial_category_tree(self, counts: Counter) -> Dict[str, List[str]]:
         filter_len_min = 3
@@ -528,7 +766,6 @@ class CorpusProcessor:
 
     def _build_language_model(self, category: str, category_tree: CategoryTree) -> None:
         tokens_by_id = self._tokens_by_id
-        token_entry_lookup = self._token_entry_lookup
 
         min_len = 3
 
@@ -538,8 +775,8 @@ class CorpusProcessor:
 
             lm_sub = self.lm_by_subcategory[category][subcategory]
             lm_sub.clear()
-            for token_entry in token_entry_lookup[subcategory]:
-                subcategory_tokens = [t for t in tokens_by_id[token_entry.id] if len(t) >= min_len]
+            for entry_id in self._get_entry_ids_of_token(subcategory).tolist():
+                subcategory_tokens = [t for t in tokens_by_id[entry_id] if len(t) >= min_len]
                 lm.update(subcategory_tokens)
                 lm_sub.update(subcategory_tokens)
 
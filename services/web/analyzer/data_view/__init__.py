@@ -1,2 +1,5 @@
-class DataViewId(str):
+from analyzer.utils import InternedId
+
+
+class DataViewId(InternedId):
     pass
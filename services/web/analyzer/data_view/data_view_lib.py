@@ -26,6 +26,8 @@ class LabelType(Enum):
 
 
 class Label(Serializable):
+    __slots__ = ("_name", "_width", "_font_size", "_serialized")
+
     KEY_NAME = "n"
     KEY_WIDTH = "w"
     KEY_FONT_SIZE = "s"
@@ -43,6 +45,9 @@ class Label(Serializable):
         self._width = width
         self._font_size = font_size
 
+        # labels are immutable, so the serialized form is built once on first use
+        self._serialized: Optional[Dict[str, Union[int, str]]] = None
+
     @property
     def name(self) -> str:
         return self._name
@@ -56,13 +61,17 @@ class Label(Serializable):
         return self._font_size or self.DEFAULT_FONT_SIZE
 
     def serialize(self) -> Dict[str, Union[int, str]]:
-        d = {self.KEY_NAME: str(self.name)}
-        if self._width:
-            d[self.KEY_WIDTH] = int(self._width)
-        if self._font_size:
-            d[self.KEY_FONT_SIZE] = int(self._font_size)
+        """Return the serialized label; the dict is shared between calls, so treat it as read-only"""
+        if self._serialized is None:
+            d = {self.KEY_NAME: str(self.name)}
+            if self._width:
+                d[self.KEY_WIDTH] = int(self._width)
+            if self._font_size:
+                d[self.KEY_FONT_SIZE] = int(self._font_size)
+
+            self._serialized = d
 
-        return d
+        return self._serialized
 
     @classmethod
     def deserialize(cls, d: Dict[str, Union[str, int]]) -> Label:
@@ -100,6 +109,8 @@ class Label(Serializable):
 
 
 class LabelSequence(Serializable, deque):
+    __slots__ = ()
+
     def __init__(self, labels: Optional[Union[List[Label], LabelSequence]] = None):
         super().__init__(labels or deque())
 
@@ -121,6 +132,11 @@ class LabelSequence(Serializable, deque):
 
 
 class DataView(Serializable):
+    __slots__ = (
+        "id", "parent_id", "dataset_id", "user_id", "transforms", "_labels", "_label_by_name",
+        "_hash",
+    )
+
     KEY_ID = "id"
     KEY_PARENT_ID = "parent_id"
     KEY_DATASET_ID = "dataset_id"
@@ -146,6 +162,10 @@ class DataView(Serializable):
         self._labels = labels or LabelSequence()
         self._label_by_name: Dict[str, Label] = {}
 
+        # a DataView never changes once created (transforming one creates a new id),
+        # so it is identified by its id and the hash is computed once
+        self._hash = hash(data_view_id)
+
     @property
     def transform_tree(self) -> TransformTree:
         return TransformTree.from_transform_list(self.transforms)
@@ -184,6 +204,14 @@ class DataView(Serializable):
             transforms=transforms,
         )
 
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+        return isinstance(other, DataView) and self.id == other.id
+
     def __repr__(self) -> str:
         return "<DataView {id}: user: {user} dataset: {dataset}>".format(
             id=self.id, user=self.user_id, dataset=self.dataset_id
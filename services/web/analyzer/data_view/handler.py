@@ -5,6 +5,7 @@ from collections import deque
 from pathlib import Path
 import json
 import logging
+import threading
 
 from analyzer.data_view.data_view_lib import (
     DataView, DataViewId, Label, LabelSequence,
@@ -15,25 +16,31 @@ from analyzer.constraint_lib import (
 from analyzer.dataset.dataset_lib import Dataset, DatasetId
 from analyzer.users.users_lib import User, UserId
 
-from analyzer.utils import Serializable, SerializableHandler, SerializableType
+from analyzer.utils import Serializable, SerializableHandler, SerializableType, flush_on_exit
 
 
 log = logging.getLogger(__name__)
 
 
-class HistoryKey(tuple, Serializable):
+class HistoryKey(Serializable):
+    __slots__ = ("_user_id", "_dataset_id", "_hash")
+
     SEPARATOR = "_"
 
-    def __new__(cls, user_id: UserId, dataset_id: DatasetId) -> HistoryKey:
-        return tuple.__new__(HistoryKey, tuple((user_id, dataset_id)))
+    def __init__(self, user_id: UserId, dataset_id: DatasetId):
+        self._user_id = user_id
+        self._dataset_id = dataset_id
+
+        # keys are immutable, so the hash is computed once rather than on every dict probe
+        self._hash = hash((user_id, dataset_id))
 
     @property
     def user_id(self) -> UserId:
-        return self[0]
+        return self._user_id
 
     @property
     def dataset_id(self) -> DatasetId:
-        return self[1]
+        return self._dataset_id
 
     def serialize(self) -> SerializableType:
         return self.SEPARATOR.join([self.user_id, self.dataset_id])
@@ -43,30 +50,49 @@ class HistoryKey(tuple, Serializable):
         user_id, dataset_id = s.split(cls.SEPARATOR)
         return HistoryKey(user_id=user_id, dataset_id=dataset_id)
 
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+
+        if not isinstance(other, HistoryKey):
+            return NotImplemented
+
+        return self._user_id == other._user_id and self._dataset_id == other._dataset_id
+
     def __repr__(self) -> str:
         return "<User:%s Dataset:%s>" % (self.user_id, self.dataset_id)
 
 
-HistoryLookup = Dict[HistoryKey, DataViewId]
+# keyed by the serialized form of a HistoryKey, i.e. "<user_id>_<dataset_id>"
+HistoryLookup = Dict[str, DataViewId]
 
 
 class DataViewHistoryHandler(SerializableHandler):
+    # writes arriving within this many seconds of each other are saved together
+    SAVE_DELAY_SEC = 1.0
+
     def __init__(self, path: Path):
         self._path = path
         self._data_view_history: HistoryLookup = {}
 
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_lock = threading.Lock()
+        flush_on_exit(self)
+
         self._loaded = False
         self.load()
 
     def serialize(self) -> Dict[SerializableType, SerializableType]:
         sorted_keys = sorted(self._data_view_history.keys())
-        return {key.serialize(): self._data_view_history[key] for key in sorted_keys}
+        return {key: self._data_view_history[key] for key in sorted_keys}
 
     @classmethod
     def deserialize(cls, d: Dict[str, str]) -> HistoryLookup:
-        return {
-            HistoryKey.deserialize(key): DataViewId(value) for key, value in d.items()
-        }
+        return {key: DataViewId(value) for key, value in d.items()}
 
     @classmethod
     def initialization_data(cls) -> HistoryLookup:
@@ -88,35 +114,57 @@ class DataViewHistoryHandler(SerializableHandler):
             return
         self._save(self._path)
 
+    def flush(self):
+        """Save any changes that are still waiting on the save timer"""
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+
+            if self._dirty:
+                self._dirty = False
+                self.save()
+
     def keys(self):
         return self._data_view_history.keys()
 
     @classmethod
-    def make_key(cls, user_id: UserId, dataset_id: DatasetId) -> HistoryKey:
-        return HistoryKey(user_id, dataset_id)
+    def make_key(cls, user_id: UserId, dataset_id: DatasetId) -> str:
+        return f"{user_id}{HistoryKey.SEPARATOR}{dataset_id}"
 
-    def has_key(self, key: HistoryKey) -> bool:
+    def has_key(self, key: str) -> bool:
         return key in self._data_view_history
 
-    def get_key(self, key: HistoryKey) -> DataViewId:
+    def get_key(self, key: str) -> DataViewId:
         return self._data_view_history.get(key)
 
-    def set_key(self, key: HistoryKey, data_view_id: DataViewId):
-        self._data_view_history[key] = data_view_id
-        self.save()
+    def set_key(self, key: str, data_view_id: DataViewId):
+        with self._save_lock:
+            self._data_view_history[key] = data_view_id
+            self._dirty = True
+
+            # restart the timer, so that a burst of changes results in a single save
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.SAVE_DELAY_SEC, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
 
     def has(self, user_id: UserId, dataset_id: DatasetId) -> bool:
-        return HistoryKey(user_id, dataset_id) in self._data_view_history
+        return self.make_key(user_id, dataset_id) in self._data_view_history
 
     def get(self, user_id: UserId, dataset_id: DatasetId) -> DataViewId:
-        return self.get_key(HistoryKey(user_id, dataset_id))
+        return self._data_view_history.get(self.make_key(user_id, dataset_id))
 
     def set(self, user_id: UserId, dataset_id: DatasetId, data_view_id: DataViewId):
-        self.set_key(HistoryKey(user_id, dataset_id), data_view_id)
+        self.set_key(self.make_key(user_id, dataset_id), data_view_id)
 
     def data_view_ids_by_user_id(self, user_id: UserId) -> List[DataViewId]:
+        # the key of this user with an empty dataset id, i.e. the common prefix of all of their keys
+        prefix = self.make_key(user_id, DatasetId(""))
         return [
-            self.get_key(dv) for dv in self._data_view_history if dv.user_id == user_id
+            data_view_id for key, data_view_id in self._data_view_history.items()
+            if key.startswith(prefix)
         ]
 
 
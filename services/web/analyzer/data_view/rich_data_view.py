@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 from typing import List
-
+from collections import OrderedDict
 import logging
+import threading
 
-from analyzer.data_view.data_view_lib import DataView
+from analyzer.data_view.data_view_lib import DataView, DataViewId
 from analyzer.dataset.dataset_lib import Dataset
 from analyzer.users.users_lib import User
 
@@ -13,6 +14,13 @@ log = logging.getLogger(__name__)
 
 
 class RichDataView(DataView):
+    __slots__ = ("data_view", "dataset", "user")
+
+    # recently used instances, shared as they are immutable and used as dict keys by the Analyzer
+    POOL_SIZE = 64
+    _pool: OrderedDict[DataViewId, RichDataView] = OrderedDict()
+    _pool_lock = threading.Lock()
+
     def __init__(self, data_view: DataView, dataset: Dataset, user: User):
         super().__init__(
             data_view_id=data_view.id,
@@ -26,6 +34,28 @@ class RichDataView(DataView):
         self.dataset = dataset
         self.user = user
 
+    @classmethod
+    def acquire(cls, data_view: DataView, dataset: Dataset, user: User) -> RichDataView:
+        """Return the pooled RichDataView wrapping these objects, creating it if necessary"""
+        data_view_id = data_view.id
+        with cls._pool_lock:
+            rich_data_view = cls._pool.get(data_view_id)
+            if (
+                rich_data_view is not None
+                and rich_data_view.data_view is data_view
+                and rich_data_view.dataset is dataset
+                and rich_data_view.user is user
+            ):
+                cls._pool.move_to_end(data_view_id)
+                return rich_data_view
+
+            rich_data_view = cls(data_view=data_view, dataset=dataset, user=user)
+            cls._pool[data_view_id] = rich_data_view
+            while len(cls._pool) > cls.POOL_SIZE:
+                cls._pool.popitem(last=False)
+
+            return rich_data_view
+
     @property
     def label_names(self) -> List[str]:
         return [label.name for label in self.labels]
@@ -1,3 +1,5 @@
+from analyzer.utils import InternedId
 
-class DatasetId(str):
-    pass
\ No newline at end of file
+
+class DatasetId(InternedId):
+    pass
@@ -1,22 +1,65 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Union
+from typing import TYPE_CHECKING
 from time import time
+import importlib
 import logging
-
-from analyzer.analyzer_lib import Analyzer
-from analyzer.constraint_lib import transform_manager, TransformDef, TransformResourceHandler
-from analyzer.query_processor_lib import QueryResponse, QueryErrorResponse
-from analyzer.dataset.dataset_lib import Dataset, DatasetId
-from analyzer.dataset.handler import DatasetHandler
-from analyzer.data_view.data_view_lib import (
-    DataView, DataViewId, LabelSequence, TransformList,
-)
-from analyzer.data_view.handler import DataViewHandler, DataViewHistoryHandler
-from analyzer.data_view.rich_data_view import RichDataView
-from analyzer.users.users_lib import User, UserHandler, UserId
-from analyzer.transforms.enrichments_lib import TagHandler
+import threading
+
+from analyzer.dataset import DatasetId
+from analyzer.data_view import DataViewId
+from analyzer.users import UserId
+from analyzer.utils import cached_property, install_exit_hooks
+
+# the modules below pull in pandas, scikit-learn and spaCy, so they are only imported
+# once a Session is actually created (or one of their names is requested from this module)
+if TYPE_CHECKING:
+    from typing import List, Dict, Tuple, Optional, Union
+
+    from analyzer.analyzer_lib import Analyzer
+    from analyzer.constraint_lib import TransformDef, TransformResourceHandler
+    from analyzer.query_processor_lib import QueryResponse
+    from analyzer.dataset.dataset_lib import Dataset
+    from analyzer.dataset.handler import DatasetHandler
+    from analyzer.data_view.data_view_lib import DataView, LabelSequence, TransformList
+    from analyzer.data_view.handler import DataViewHandler, DataViewHistoryHandler
+    from analyzer.data_view.rich_data_view import RichDataView
+    from analyzer.users.users_lib import User, UserHandler
+    from analyzer.transforms.enrichments_lib import TagHandler
+
+
+_LAZY_MODULE_BY_NAME = {
+    "Analyzer": "analyzer.analyzer_lib",
+    "transform_manager": "analyzer.constraint_lib",
+    "TransformDef": "analyzer.constraint_lib",
+    "TransformResourceHandler": "analyzer.constraint_lib",
+    "QueryResponse": "analyzer.query_processor_lib",
+    "QueryErrorResponse": "analyzer.query_processor_lib",
+    "Dataset": "analyzer.dataset.dataset_lib",
+    "DatasetHandler": "analyzer.dataset.handler",
+    "DataView": "analyzer.data_view.data_view_lib",
+    "LabelSequence": "analyzer.data_view.data_view_lib",
+    "TransformList": "analyzer.constraint_lib",
+    "DataViewHandler": "analyzer.data_view.handler",
+    "DataViewHistoryHandler": "analyzer.data_view.handler",
+    "RichDataView": "analyzer.data_view.rich_data_view",
+    "User": "analyzer.users.users_lib",
+    "UserHandler": "analyzer.users.users_lib",
+    "TagHandler": "analyzer.transforms.enrichments_lib",
+}
+
+
+def __getattr__(name: str):
+    """Lazily resolve the names that used to be imported eagerly"""
+    try:
+        module_name = _LAZY_MODULE_BY_NAME[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
 
 
 log = logging.getLogger(__name__)
@@ -45,32 +88,20 @@ class Session:
     ):
         log.info("Creating new session")
 
+        # here rather than in the handlers, which may first be created on a request thread,
+        # as signal handlers can only be installed from the main thread
+        install_exit_hooks()
+
         self.config_dir = config_dir
         self.data_dir = data_dir
 
-        users_path = config_dir / users_filename
-        datasets_path = config_dir / datasets_filename
-        data_views_path = config_dir / data_views_filename
-        data_view_history_path = config_dir / data_view_history_filename
-        tag_dir = config_dir
-
-        self.user_handler = UserHandler(users_path)
-        self.dataset_handler = DatasetHandler(datasets_path)
-        self.data_view_handler = DataViewHandler(data_views_path)
-        self.data_view_history_handler = DataViewHistoryHandler(data_view_history_path)
-        self.tag_handler = TagHandler(tag_dir, tag_prefix)
-
-        self.transform_resource_handler = TransformResourceHandler(
-            tag_handler=self.tag_handler,
-        )
-
-        self._analyzer = Analyzer(
-            data_dir=self.data_dir,
-            user_handler=self.user_handler,
-            dataset_handler=self.dataset_handler,
-            data_view_handler=self.data_view_handler,
-            transform_resource_handler=self.transform_resource_handler,
-        )
+        # the handlers and the analyzer are created from these on first access
+        self._users_path = config_dir / users_filename
+        self._datasets_path = config_dir / datasets_filename
+        self._data_views_path = config_dir / data_views_filename
+        self._data_view_history_path = config_dir / data_view_history_filename
+        self._tag_dir = config_dir
+        self._tag_prefix = tag_prefix
 
         user = self.user_handler.default_user
         dataset_id = self.user_handler.get_last_dataset_id(user.id)
@@ -80,13 +111,82 @@ class Session:
         else:
             data_view_id = None
 
+        # set once the warm up is done; the analyzer is not handed out before then
+        self._warmed_up = threading.Event()
+
         if data_view_id:
+            threading.Thread(
+                target=self._warm_up, args=(data_view_id,), name="session-warm-up", daemon=True,
+            ).start()
+        else:
+            log.info("DataView ID is %s", data_view_id)
+            self._warmed_up.set()
+
+    def _warm_up(self, data_view_id: DataViewId):
+        """Load the data frame of the most recent DataView in the background"""
+        try:
             log.info("warming up data frame for %s", data_view_id)
             start_time = time()
-            self._analyzer.active_dataframe(self.rich_data_view(data_view_id))
+            self._warm_analyzer.active_dataframe(self.rich_data_view(data_view_id))
             log.info(f"done: {time() - start_time:.2f} sec")
-        else:
-            log.info("DataView ID is %s", data_view_id)
+        except Exception:
+            log.exception("Could not warm up data frame for %s", data_view_id)
+        finally:
+            self._warmed_up.set()
+
+    @cached_property
+    def user_handler(self) -> UserHandler:
+        from analyzer.users.users_lib import UserHandler
+
+        return UserHandler(self._users_path)
+
+    @cached_property
+    def dataset_handler(self) -> DatasetHandler:
+        from analyzer.dataset.handler import DatasetHandler
+
+        return DatasetHandler(self._datasets_path)
+
+    @cached_property
+    def data_view_handler(self) -> DataViewHandler:
+        from analyzer.data_view.handler import DataViewHandler
+
+        return DataViewHandler(self._data_views_path)
+
+    @cached_property
+    def data_view_history_handler(self) -> DataViewHistoryHandler:
+        from analyzer.data_view.handler import DataViewHistoryHandler
+
+        return DataViewHistoryHandler(self._data_view_history_path)
+
+    @cached_property
+    def tag_handler(self) -> TagHandler:
+        from analyzer.transforms.enrichments_lib import TagHandler
+
+        return TagHandler(self._tag_dir, self._tag_prefix)
+
+    @cached_property
+    def transform_resource_handler(self) -> TransformResourceHandler:
+        from analyzer.constraint_lib import TransformResourceHandler
+
+        return TransformResourceHandler(tag_handler=self.tag_handler)
+
+    @property
+    def _analyzer(self) -> Analyzer:
+        # requests wait for the warm up, rather than loading the same data frame concurrently
+        self._warmed_up.wait()
+        return self._warm_analyzer
+
+    @cached_property
+    def _warm_analyzer(self) -> Analyzer:
+        from analyzer.analyzer_lib import Analyzer
+
+        return Analyzer(
+            data_dir=self.data_dir,
+            user_handler=self.user_handler,
+            dataset_handler=self.dataset_handler,
+            data_view_handler=self.data_view_handler,
+            transform_resource_handler=self.transform_resource_handler,
+        )
 
     def get_most_recent_dataset_id(self, user: Union[User, UserId]) -> DatasetId:
         return self.user_handler.get_last_dataset_id(user.id)
@@ -115,9 +215,11 @@ class Session:
         return dataset
 
     def rich_data_view(self, data_view_id: DataViewId) -> RichDataView:
+        from analyzer.data_view.rich_data_view import RichDataView
+
         data_view = self.data_view_handler.by_id(data_view_id)
-        log.info(f"DataView {data_view} from {data_view_id}")
-        return RichDataView(
+        log.info("DataView %s from %s", data_view, data_view_id)
+        return RichDataView.acquire(
             data_view=data_view,
             dataset=self.dataset_handler.by_id(data_view.dataset_id),
             user=self.user_handler.by_id(data_view.user_id),
@@ -128,6 +230,8 @@ class Session:
 
     @classmethod
     def get_transform_defs(cls) -> List[TransformDef]:
+        from analyzer.constraint_lib import transform_manager
+
         return list(transform_manager.get_transform_defs())
 
     def get_most_recent_data_view(
@@ -229,6 +333,8 @@ class Session:
         return {key: list(tag_map.get_tags_by_key(key)) for key in primary_keys}
 
     def count_uniques(self, column_name: str, data_view_id: DataViewId) -> QueryResponse:
+        from analyzer.query_processor_lib import QueryResponse, QueryErrorResponse
+
         data_view = self.rich_data_view(data_view_id)
         if not data_view:
             return QueryErrorResponse("No active DataView")
@@ -246,6 +352,8 @@ class Session:
         data_view_id: DataViewId,
         count: int = 20,
     ) -> QueryResponse:
+        from analyzer.query_processor_lib import QueryResponse, QueryErrorResponse
+
         data_view = self.rich_data_view(data_view_id)
         if not data_view:
             return QueryErrorResponse("No active DataView")
@@ -265,6 +373,8 @@ class Session:
         date_time_column_name: str,
         data_view_id: DataViewId,
     ) -> QueryResponse:
+        from analyzer.query_processor_lib import QueryResponse, QueryErrorResponse
+
         data_view = self.rich_data_view(data_view_id)
 
         if not data_view:
@@ -1,2 +1,5 @@
-class UserId(str):
+from analyzer.utils import InternedId
+
+
+class UserId(InternedId):
     pass
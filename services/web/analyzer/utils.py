@@ -2,8 +2,13 @@ from __future__ import annotations
 from abc import ABCMeta
 from typing import List, Dict, Union
 from pathlib import Path
+from threading import Lock, RLock
+from weakref import WeakSet, WeakValueDictionary
+import atexit
 import json
 import logging
+import signal
+import sys
 
 
 log = logging.getLogger(__name__)
@@ -12,7 +17,97 @@ log = logging.getLogger(__name__)
 SerializableType = Union[str, float, List, Dict]
 
 
+# the objects whose flush() is called on exit, held weakly so that this does not keep them alive
+_flushed_on_exit: WeakSet = WeakSet()
+_exit_hooks_lock = Lock()
+_atexit_installed = False
+_sigterm_installed = False
+
+
+def flush_on_exit(obj):
+    """Call obj.flush() on exit, once install_exit_hooks has been called"""
+    _flushed_on_exit.add(obj)
+
+
+def _flush_all():
+    for obj in list(_flushed_on_exit):
+        obj.flush()
+
+
+def _exit_on_sigterm(signum, frame):
+    # atexit hooks do not run when the process is killed by a signal, so exit normally instead
+    sys.exit(128 + signum)
+
+
+def install_exit_hooks():
+    """Flush the registered objects on exit, including on SIGTERM; call from the main thread"""
+    global _atexit_installed, _sigterm_installed
+
+    with _exit_hooks_lock:
+        if not _atexit_installed:
+            atexit.register(_flush_all)
+            _atexit_installed = True
+
+        if _sigterm_installed:
+            return
+
+        try:
+            # leave any handler the application installed itself in place
+            if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, _exit_on_sigterm)
+            _sigterm_installed = True
+        except ValueError:
+            log.warning("Could not install the SIGTERM handler outside of the main thread")
+
+
+class cached_property:
+    """A property computed once per instance, like functools.cached_property which needs Python 3.8"""
+
+    def __init__(self, func):
+        self.func = func
+        self.attrname = func.__name__
+        self.__doc__ = func.__doc__
+        self.lock = RLock()
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        cache = instance.__dict__
+        try:
+            return cache[self.attrname]
+        except KeyError:
+            pass
+
+        with self.lock:
+            # another thread may have computed the value while this one waited
+            if self.attrname not in cache:
+                cache[self.attrname] = self.func(instance)
+            return cache[self.attrname]
+
+
+class InternedId(str):
+    """A string id with a single live instance per distinct value, so that equal ids are also identical"""
+    _instances: WeakValueDictionary
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # weak values, so that ids nobody refers to any more are dropped
+        cls._instances = WeakValueDictionary()
+
+    def __new__(cls, value: str = ""):
+        value = str(value)
+        instance = cls._instances.get(value)
+        if instance is None:
+            instance = super().__new__(cls, value)
+            cls._instances[value] = instance
+        return instance
+
+
 class Serializable:
+    # empty, so that subclasses declaring __slots__ do not get a __dict__ from here
+    __slots__ = ()
+
     def serialize(self) -> SerializableType:
         raise NotImplementedError()
 
@@ -49,9 +144,11 @@ class SerializableHandler(Serializable, metaclass=ABCMeta):
             with open(path, "w") as f:
                 json.dump(obj=self.serialize(), fp=f)
             """
+            # encode in one pass with the C encoder, rather than json.dump's many small writes
+            data = json.dumps(self.serialize())
             path.touch(exist_ok=True)
             with path.absolute().open(mode="w") as f:
-                json.dump(obj=self.serialize(), fp=f)
+                f.write(data)
         finally:
             log.debug("end save %s", self.__class__.__name__)
 
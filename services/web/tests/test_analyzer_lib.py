@@ -1,4 +1,12 @@
 import logging
+from types import SimpleNamespace
+
+import pandas as pd
+
+from analyzer.analyzer_lib import Analyzer
+from analyzer.constraint_lib import ExactMatch, HasTag, TransformList
+from analyzer.data_view import DataViewId
+from analyzer.dataset import DatasetId
 
 logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger(__name__)
@@ -6,3 +14,114 @@ log = logging.getLogger(__name__)
 
 def test_find_nearest_base1():
     pass
+
+
+def test_find_cached_prefix():
+    t = [
+        ExactMatch(column_name="aaa", value="bbb", operation="add"),
+        ExactMatch(column_name="ccc", value="ddd", operation="add"),
+        ExactMatch(column_name="eee", value="fff", operation="add"),
+    ]
+
+    id_by_transform_key = {
+        Analyzer.get_transform_key([]): DataViewId("1"),
+        Analyzer.get_transform_key(t[:1]): DataViewId("2"),
+        Analyzer.get_transform_key(t[1:2]): DataViewId("3"),
+    }
+
+    # the longest cached prefix wins
+    data_view_id, remaining = Analyzer.get_id_of_cached_prefix_df(t, id_by_transform_key)
+    assert data_view_id == "2"
+    assert remaining == t[1:]
+
+    # prefixes are compared with the target's own transforms, wherever they sit in the parent
+    data_view_id, remaining = Analyzer.get_id_of_cached_prefix_df(t[1:], id_by_transform_key)
+    assert data_view_id == "3"
+    assert remaining == t[2:]
+
+    # the base DataView (no transforms) is not treated as a prefix
+    data_view_id, remaining = Analyzer.get_id_of_cached_prefix_df(t[2:], id_by_transform_key)
+    assert data_view_id is None
+    assert remaining == t[2:]
+
+    data_view_id, remaining = Analyzer.get_id_of_cached_prefix_df(t[2:], {})
+    assert data_view_id is None
+    assert remaining == t[2:]
+
+
+def test_find_nearest_df():
+    t = [
+        ExactMatch(column_name="aaa", value="bbb", operation="add"),
+        ExactMatch(column_name="ccc", value="ddd", operation="add"),
+        ExactMatch(column_name="eee", value="fff", operation="add"),
+    ]
+
+    cached_transforms = {
+        DataViewId("1"): [],
+        DataViewId("2"): t[:1],
+        DataViewId("3"): t[1:],
+    }
+    id_by_transform_key = {
+        Analyzer.get_transform_key(transforms): data_view_id
+        for data_view_id, transforms in cached_transforms.items()
+    }
+
+    # a cached prefix is used as soon as it is found, without scanning the other DataViews
+    data_view_id, remaining = Analyzer.get_id_of_nearest_df(
+        t, id_by_transform_key, cached_transforms,
+    )
+    assert data_view_id == "2"
+    assert remaining == t[1:]
+
+    # without a cached prefix, the DataView sharing the most transforms is used
+    data_view_id, remaining = Analyzer.get_id_of_nearest_df(
+        [t[2], t[1]], id_by_transform_key, cached_transforms,
+    )
+    assert data_view_id == "3"
+    assert set(remaining) == set()
+
+    # with only the base DataView cached, it is used
+    data_view_id, remaining = Analyzer.get_id_of_nearest_df(
+        t, {Analyzer.get_transform_key([]): DataViewId("1")}, {DataViewId("1"): []},
+    )
+    assert data_view_id == "1"
+    assert set(remaining) == set(t)
+
+
+def test_persisted_df(tmp_path):
+    dataset_path = tmp_path / "dataset.csv"
+    dataset_path.write_text("aaa,ccc\nbbb,ddd\n")
+
+    analyzer = Analyzer(
+        data_dir=tmp_path,
+        data_view_handler=None,
+        dataset_handler=None,
+        user_handler=None,
+        transform_resource_handler=None,
+    )
+
+    def data_view(transforms):
+        return SimpleNamespace(
+            id=DataViewId("1"),
+            dataset_id=DatasetId("1"),
+            dataset=SimpleNamespace(filename=dataset_path.name),
+            transforms=TransformList(transforms),
+        )
+
+    match = ExactMatch(column_name="aaa", value="bbb", operation="add")
+    has_tag = HasTag(tag="pending", operation="add")
+
+    # base DataViews and DataViews reading tags are not persisted
+    assert Analyzer.is_persistable(data_view([match]))
+    assert not Analyzer.is_persistable(data_view([]))
+    assert not Analyzer.is_persistable(data_view([match, has_tag]))
+
+    df = pd.read_csv(dataset_path)
+    analyzer._persist_df(data_view([match]), df)
+    assert analyzer._load_persisted_df(data_view([match])).equals(df)
+    assert analyzer._load_persisted_df(data_view([])) is None
+
+    # a file that was changed after it was written is not unpickled
+    path = analyzer._get_persisted_df_path(analyzer._get_persisted_df_key(data_view([match])))
+    path.write_bytes(path.read_bytes() + b"x")
+    assert analyzer._load_persisted_df(data_view([match])) is None
@@ -0,0 +1,131 @@
+import math
+import random
+from collections import Counter, namedtuple
+
+from analyzer.contrib.autocat_lib import Corpus, CorpusProcessor, DatasetEntry, TextProcessor
+
+
+FakeToken = namedtuple("FakeToken", "dep")
+FakeSpacyToken = namedtuple("FakeSpacyToken", "lemma_ tag_ pos_ dep")
+FakeDoc = namedtuple("FakeDoc", "noun_chunks")
+
+
+class FakeVocab:
+    def __contains__(self, word: str) -> bool:
+        return False
+
+    def has_vector(self, word: str) -> bool:
+        return False
+
+
+class FakeParser:
+    vocab = FakeVocab()
+
+
+def build_corpus(seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(30)] + ["tax form", "web site"]
+
+    corpus = Corpus(text_processor=None)
+    dep_by_token_and_entry = {}
+    for entry_id in range(300):
+        entry = DatasetEntry(entry_id, f"pkey{entry_id}", rng.randrange(400), "")
+        tokens = {word: FakeToken(dep=rng.randrange(1, 5)) for word in rng.sample(words, 6)}
+        for word, token in tokens.items():
+            dep_by_token_and_entry[word, entry_id] = token.dep
+        corpus.add_entry(entry, tokens)
+
+    return corpus, dep_by_token_and_entry
+
+
+def count_like_before(corpus, dep_by_token_and_entry, include_deps, exclude_words, entry_ids):
+    """The per-entry loops the token table replaced, kept as the reference"""
+    base = 2
+    max_age_exponent = int(1 + math.log(corpus.age_in_weeks_max, base))
+    allowable_entry_ids = set(entry_ids or [])
+
+    weighted_token_counts = Counter()
+    for i, age_exponent in enumerate(range(2, max_age_exponent + 1)):
+        token_counts = Counter()
+        for age in range(base ** (age_exponent - 1) + 1, base ** age_exponent + 1):
+            for entry_id in corpus.ids_by_age.get(age, []):
+                if allowable_entry_ids and entry_id not in allowable_entry_ids:
+                    continue
+                for token in corpus.tokens_by_id.get(entry_id, []):
+                    if any(exclude_word in token for exclude_word in exclude_words):
+                        continue
+                    token_counts[token] += dep_by_token_and_entry[token, entry_id] in include_deps
+
+        weight = base ** (max_age_exponent - i - 2)
+        for token, count in token_counts.items():
+            if len(token) >= 2:
+                weighted_token_counts[token] += weight * count
+
+    return weighted_token_counts
+
+
+def test_time_weighted_counts_match_per_entry_counts():
+    corpus, dep_by_token_and_entry = build_corpus()
+    exclude_words = {"w1"}
+    include_deps = {1, 2}
+
+    for entry_ids in [None, list(range(0, 300, 3))]:
+        processor = CorpusProcessor(corpus, exclude_words)
+        counts = processor._get_time_weighted_counts(include_deps, entry_ids)
+        expected = count_like_before(
+            corpus, dep_by_token_and_entry, include_deps, exclude_words, entry_ids,
+        )
+
+        # the order matters as well, as most_common breaks ties by insertion order
+        assert list(counts.items()) == list(expected.items())
+        assert counts.most_common() == expected.most_common()
+
+
+def test_entry_ids_of_token():
+    corpus, dep_by_token_and_entry = build_corpus()
+    processor = CorpusProcessor(corpus)
+
+    for token in corpus.tokens:
+        expected = [entry_id for entry_id, tokens in corpus.tokens_by_id.items() if token in tokens]
+        assert processor._get_entry_ids_of_token(token).tolist() == expected
+
+    assert processor._get_entry_ids_of_token("not a token").tolist() == []
+
+
+def tokens_like_before(text_processor: TextProcessor, doc: FakeDoc):
+    """The per-key writes _process_noun_chunk used to make, kept as the reference"""
+    tokens = {}
+    for chunk in doc.noun_chunks:
+        chunk_words = []
+        last_spacy_token = None
+        for spacy_token in chunk:
+            chunk_word = spacy_token.lemma_.lower()
+            tokens[chunk_word] = spacy_token
+            chunk_words.append(chunk_word)
+            last_spacy_token = spacy_token
+
+        for bigram in text_processor.get_bigrams(chunk_words):
+            if bigram not in tokens:
+                tokens[bigram] = last_spacy_token
+
+    return tokens
+
+
+def test_bigrams_keep_their_first_token():
+    def token(lemma: str, dep: int) -> FakeSpacyToken:
+        return FakeSpacyToken(lemma_=lemma, tag_="NN", pos_="NOUN", dep=dep)
+
+    doc = FakeDoc(noun_chunks=[
+        [token("Tax", 1), token("form", 2)],
+        [token("money", 3), token("a", 4)],
+        [token("tax", 5), token("form", 6)],
+        [token("money", 7), token("a", 8)],
+    ])
+
+    text_processor = TextProcessor(parser=FakeParser())
+    tokens = text_processor._tokens_from_doc(doc)
+
+    assert list(tokens.items()) == list(tokens_like_before(text_processor, doc).items())
+    assert tokens["tax form"].dep == 2
+    assert tokens["money a"].dep == 4
+    assert tokens["form"].dep == 6
@@ -1,4 +1,5 @@
 import logging
+import os
 
 from analyzer.users import UserId
 from analyzer.dataset import DatasetId
@@ -6,7 +7,9 @@ from analyzer.data_view.data_view_lib import Label, LabelSet
 from analyzer.data_view.handler import HistoryKey
 
 
-logging.basicConfig(level=logging.DEBUG)
+# quiet by default; set LOG_LEVEL (e.g. LOG_LEVEL=DEBUG) to see the analyzer's logging
+logging.getLogger().addHandler(logging.NullHandler())
+logging.getLogger().setLevel(os.environ.get("LOG_LEVEL", "WARNING"))
 
 log = logging.getLogger(__name__)
 
@@ -0,0 +1,75 @@
+import json
+import signal
+import threading
+import time
+
+from analyzer import utils
+from analyzer.data_view import DataViewId
+from analyzer.data_view.handler import DataViewHistoryHandler
+from analyzer.dataset import DatasetId
+from analyzer.users import UserId
+
+
+def wait_for(condition, timeout_sec: float = 5.0) -> bool:
+    deadline = time.time() + timeout_sec
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_set_is_saved_once_after_the_delay(tmp_path):
+    path = tmp_path / "data_view_history.json"
+    handler = DataViewHistoryHandler(path)
+    handler.SAVE_DELAY_SEC = 0.2
+
+    saves = []
+    save = handler.save
+    handler.save = lambda: saves.append(1) or save()
+
+    for data_view_id in ["1", "2", "3"]:
+        handler.set(UserId("user"), DatasetId("dataset"), DataViewId(data_view_id))
+
+    # a burst of changes waits on the timer, and is then saved together
+    assert json.loads(path.read_text()) == {}
+    assert wait_for(lambda: saves)
+    assert json.loads(path.read_text()) == {"user_dataset": "3"}
+
+    time.sleep(2 * handler.SAVE_DELAY_SEC)
+    assert len(saves) == 1
+
+
+def test_flush_saves_pending_changes(tmp_path):
+    path = tmp_path / "data_view_history.json"
+    handler = DataViewHistoryHandler(path)
+    handler.SAVE_DELAY_SEC = 60
+
+    handler.set(UserId("user"), DatasetId("dataset"), DataViewId("1"))
+    handler.flush()
+    assert json.loads(path.read_text()) == {"user_dataset": "1"}
+    assert handler._save_timer is None
+
+    # the exit hook flushes every live handler
+    handler.set(UserId("user"), DatasetId("dataset"), DataViewId("2"))
+    utils._flush_all()
+    assert json.loads(path.read_text()) == {"user_dataset": "2"}
+
+
+def test_install_exit_hooks_from_the_main_thread():
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    sigterm_installed = utils._sigterm_installed
+    utils._sigterm_installed = False
+    try:
+        # off the main thread the handler cannot be installed, which does not stop a later attempt
+        thread = threading.Thread(target=utils.install_exit_hooks)
+        thread.start()
+        thread.join()
+        assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+        utils.install_exit_hooks()
+        assert signal.getsignal(signal.SIGTERM) is utils._exit_on_sigterm
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        utils._sigterm_installed = sigterm_installed